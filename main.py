@@ -1,110 +1,59 @@
 import os
-import json
-import re
-import requests
-from dotenv import load_dotenv
-from openai import AzureOpenAI
+import contextlib
 from mcp.server.fastmcp import FastMCP
+from starlette.responses import JSONResponse
 
-# Load environment variables
-load_dotenv()
-
-# Azure OpenAI client
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_KEY"),
-    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+from optiflow.core import (
+    BATCH_PENDING_STATES,
+    HTTP,
+    REQUIRED_FIELDS,
+    WEBHOOKS,
+    cache_metrics,
+    classify_and_extract,
+    classify_intent,
+    collect_pulse_batch,
+    extract_fields,
+    submit_pulse_batch,
+    submit_webhook,
+    warm_up,
 )
-DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
-
-# Define webhooks
-WEBHOOKS = {
-    "leave_request": "https://starfish-special-bulldog.ngrok-free.app/webhook/leave-request",
-    "onboarding": "https://starfish-special-bulldog.ngrok-free.app/webhook/onboarding",
-    "pulse_check": "https://starfish-special-bulldog.ngrok-free.app/webhook/pulse-check",
-}
-
-# Required fields
-REQUIRED_FIELDS = {
-    "onboarding": [
-        "employee_id", "first_name", "last_name", "email",
-        "department", "role", "start_date", "manager_email"
-    ],
-    "leave_request": ["employee_id", "start_date", "end_date", "reason"],
-    "pulse_check": [],
-}
 
 # Initialize MCP server
-server = FastMCP("mcp-server-optiflow")
-
-def classify_intent(message: str) -> str:
-    system_prompt = (
-        "You're a friendly HR assistant. Respond politely to greetings/small talk, "
-        "but also classify HR-related messages into one of the following only: "
-        "onboarding, leave_request, pulse_check.\n"
-        "Examples:\n"
-        "I want to take Monday off => leave_request\n"
-        "We have a new developer joining => onboarding\n"
-        "Here's the team’s monthly feedback => pulse_check"
-    )
-    response = client.chat.completions.create(
-        model=DEPLOYMENT,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": message},
-        ],
-        temperature=0,
-    )
-    intent = response.choices[0].message.content.strip().lower()
-    if intent not in WEBHOOKS:
-        return f"smalltalk::{intent}"
-    return intent
-
-def extract_fields(intent: str, message: str) -> dict:
-    if intent not in REQUIRED_FIELDS:
-        return {}
-    prompt = (
-        f"You are extracting structured JSON from this HR message. Intent: {intent}. "
-        f"Return ONLY a JSON with fields: {REQUIRED_FIELDS[intent]}"
-    )
-    response = client.chat.completions.create(
-        model=DEPLOYMENT,
-        messages=[
-            {"role": "system", "content": prompt},
-            {"role": "user", "content": message},
-        ],
-        temperature=0,
-    )
-    content = re.sub(r"^```(json)?\s*|\s*```$", "", response.choices[0].message.content.strip())
-    return json.loads(content)
+# Stateless HTTP so any worker process can serve any request
+server = FastMCP("mcp-server-optiflow", host="0.0.0.0", stateless_http=True)
 
 # -----------------------------
 # MCP Tools
 # -----------------------------
 @server.tool()
-def classify(message: str) -> str:
-    return classify_intent(message)
+async def classify(message: str) -> str:
+    return await classify_intent(message)
+
+@server.tool()
+async def extract(intent: str, message: str) -> dict:
+    return await extract_fields(intent, message)
 
 @server.tool()
-def extract(intent: str, message: str) -> dict:
-    return extract_fields(intent, message)
+async def route(message: str) -> dict:
+    """Classify a message and extract its fields in one step."""
+    return await classify_and_extract(message)
 
 @server.tool()
 def get_required_fields(intent: str) -> list:
-    return REQUIRED_FIELDS.get(intent, [])
+    return list(REQUIRED_FIELDS.get(intent, ()))
 
 @server.tool()
 def get_webhook(intent: str) -> str:
     return WEBHOOKS.get(intent, "")
 
 @server.tool()
-def confirm_routing(intent: str, data: dict, confirm: bool = False) -> str:
+async def confirm_routing(intent: str, data: dict, confirm: bool = False) -> str:
     """Ask for confirmation before sending data to the webhook."""
     if not confirm:
         return f"⚠️ Do you want me to send this {intent} data to {WEBHOOKS[intent]}? Reply 'yes' to confirm."
     
     try:
-        response = requests.post(WEBHOOKS[intent], json=data, timeout=10)
+        response = await submit_webhook(intent, data)
         if response.status_code == 200:
             return f"✅ Data successfully sent to {intent} webhook."
         else:
@@ -112,20 +61,70 @@ def confirm_routing(intent: str, data: dict, confirm: bool = False) -> str:
     except Exception as e:
         return f"❌ Error while sending to webhook: {e}"
 
+@server.tool()
+async def submit_pulse_checks(messages: list[str]) -> str:
+    """Queue bulk pulse-check feedback through the Azure Batch API (24h, lower cost)."""
+    try:
+        batch_id = await submit_pulse_batch(messages)
+        if batch_id is None:
+            return "⚠️ No messages to submit."
+        return f"🕒 Submitted {len(messages)} messages as batch {batch_id}. Check back with collect_pulse_checks."
+    except Exception as e:
+        return f"❌ Error while submitting batch: {e}"
+
+@server.tool()
+async def collect_pulse_checks(batch_id: str) -> str:
+    """Send the pulse checks of a completed batch to the webhook.
+
+    Delivery is tracked per server process, so collecting through another
+    worker or after a restart can resend pulse checks.
+    """
+    try:
+        result = await collect_pulse_batch(batch_id)
+    except Exception as e:
+        return f"❌ Error while collecting batch: {e}"
+    if result["status"] in BATCH_PENDING_STATES:
+        return f"🕒 Batch {batch_id} is still {result['status']}."
+    if result["status"] != "completed":
+        return f"❌ Batch {batch_id} ended as {result['status']}; nothing was sent."
+    summary = (
+        f"✅ Sent {result['sent']} pulse checks to webhook "
+        f"({result['already_sent']} already sent earlier), "
+        f"{result['failed']} failed in the batch."
+    )
+    if result["post_failed"]:
+        summary += f" {result['post_failed']} webhook posts failed; collect again to retry them."
+    if result["not_pulse"]:
+        summary += "\nNot pulse checks, route these individually:\n" + "\n".join(
+            f"- [{item['custom_id']}] {item['intent']}: {item['message']}"
+            for item in result["not_pulse"]
+        )
+    return summary
+
+@server.custom_route("/metrics", methods=["GET"])
+async def metrics(request):
+    return JSONResponse(cache_metrics())
+
 # -----------------------------
-# Run MCP server
+# ASGI app (gunicorn main:app -k uvicorn_worker.UvicornWorker)
 # -----------------------------
+app = server.streamable_http_app()
+_session_lifespan = app.router.lifespan_context
+
+@contextlib.asynccontextmanager
+async def _lifespan(app):
+    async with _session_lifespan(app):
+        await warm_up()
+        yield
+    await HTTP.aclose()
+
+app.router.lifespan_context = _lifespan
+
 # -----------------------------
 # Run MCP server
 # -----------------------------
 if __name__ == "__main__":
-    from mcp.server.fastmcp import make_fastapi_app
     import uvicorn
-    import os
-
-    # create a FastAPI app from the MCP server
-    app = make_fastapi_app(server)
 
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)))
-else:  # ✅ local dev / stdio
-        server.run()
\ No newline at end of file
+    # loop="auto" runs on uvloop when it is installed (not on Windows)
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8080)), loop="auto")
@@ -0,0 +1,29 @@
+from optiflow.core import (
+    HTTP,
+    REQUIRED_FIELDS,
+    WEBHOOKS,
+    cache_metrics,
+    cached,
+    classify_and_extract,
+    classify_intent,
+    collect_pulse_batch,
+    extract_fields,
+    submit_pulse_batch,
+    submit_webhook,
+    warm_up,
+)
+
+__all__ = [
+    "HTTP",
+    "REQUIRED_FIELDS",
+    "WEBHOOKS",
+    "cache_metrics",
+    "cached",
+    "classify_and_extract",
+    "classify_intent",
+    "collect_pulse_batch",
+    "extract_fields",
+    "submit_pulse_batch",
+    "submit_webhook",
+    "warm_up",
+]
@@ -0,0 +1,512 @@
+import os
+import asyncio
+import re
+import hashlib
+import functools
+import inspect
+import copy
+import threading
+import time
+import itertools
+from collections import OrderedDict
+import httpx
+import orjson
+import hnswlib
+from cachetools import TTLCache
+from dotenv import load_dotenv
+from fastembed import TextEmbedding
+from openai import AsyncAzureOpenAI
+
+# Load environment variables
+load_dotenv()
+
+# Azure OpenAI client
+client = AsyncAzureOpenAI(
+    api_key=os.getenv("AZURE_OPENAI_KEY"),
+    api_version=os.getenv("AZURE_OPENAI_API_VERSION"),
+    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+)
+DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+# Global-batch deployment used for non-interactive bulk pulse checks
+BATCH_DEPLOYMENT = os.getenv("AZURE_OPENAI_BATCH_DEPLOYMENT", DEPLOYMENT)
+
+# Shared webhook client: keep-alive connections instead of a handshake per call
+HTTP = httpx.AsyncClient(
+    http2=True,
+    timeout=10.0,
+    limits=httpx.Limits(max_keepalive_connections=20),
+)
+
+# Define webhooks
+WEBHOOKS = {
+    "leave_request": "https://starfish-special-bulldog.ngrok-free.app/webhook/leave-request",
+    "onboarding": "https://starfish-special-bulldog.ngrok-free.app/webhook/onboarding",
+    "pulse_check": "https://starfish-special-bulldog.ngrok-free.app/webhook/pulse-check",
+}
+
+# Required fields
+REQUIRED_FIELDS = {
+    "onboarding": (
+        "employee_id", "first_name", "last_name", "email",
+        "department", "role", "start_date", "manager_email"
+    ),
+    "leave_request": ("employee_id", "start_date", "end_date", "reason"),
+    "pulse_check": (),
+}
+REQUIRED_SET = {intent: frozenset(fields) for intent, fields in REQUIRED_FIELDS.items()}
+# Compact pipe-separated field lists for prompts
+FIELDS_STR = {intent: "|".join(fields) for intent, fields in REQUIRED_FIELDS.items()}
+
+# Keyword fast path: resolve obvious intents locally before asking the LLM
+CASUAL = frozenset({
+    "hi", "hello", "hey", "yo", "how are you",
+    "good morning", "good afternoon", "good evening",
+})
+GREETING_RE = re.compile(r"^(hi|hello|hey|yo|good (morning|afternoon|evening))\b", re.I)
+# Words allowed after a greeting ("hi there team") before the LLM must decide
+GREETING_MAX_EXTRA_WORDS = 2
+GREETING_REPLY = "hello! how can i help you with hr today?"
+INTENT_PATTERNS = {
+    "leave_request": re.compile(r"\b(leave|time off|\w*days? off|vacation|pto|sick)\b", re.I),
+    "onboarding": re.compile(r"\b(onboard\w*|new hire|joining|starts on)\b", re.I),
+    "pulse_check": re.compile(r"\b(feedback|pulse|survey|morale)\b", re.I),
+}
+
+# Message canonicalization: collapse case, whitespace and punctuation
+_WS = re.compile(r"\s+")
+_PUNCT = re.compile(r"[^\w\s@./-]")
+
+# Fallback for replies wrapped in markdown code fences
+_FENCE_RE = re.compile(r"^```(?:json)?\s*|\s*```$", re.MULTILINE)
+
+# One stable system prompt shared by every LLM call. Only the user message
+# varies, so Azure's automatic prompt caching can reuse the prefix.
+SYSTEM_PROMPT = (
+    "OptiFlow HR router. Intents: onboarding|leave_request|pulse_check.\n"
+    "\n"
+    "fields:\n"
+    + "".join(f"{name}:{FIELDS_STR[name] or '-'}\n" for name in REQUIRED_FIELDS)
+    + "\n"
+    "User message = TASK line + HR message.\n"
+    "TASK: classify -> intent name only. Greeting/small talk: one short polite sentence.\n"
+    "TASK: extract <intent> -> JSON of that intent's fields present in message.\n"
+    'TASK: route -> JSON {"intent": <intent>, "fields": {...}}. Small talk: '
+    '{"intent": "smalltalk", "reply": <short reply>, "fields": {}}.\n'
+    "\n"
+    "Rules:\n"
+    "- Omit fields not stated. Never invent values.\n"
+    "- Dates YYYY-MM-DD; resolve relative dates only given an absolute reference.\n"
+    "- employee_id verbatim (E1042, 00731).\n"
+    "- email, manager_email lowercase.\n"
+    "- reason short: vacation|sick|family|medical|personal.\n"
+    "- pulse_check fields always {}.\n"
+    "- JSON only, no fences, no commentary.\n"
+    "\n"
+    "Examples:\n"
+    "TASK: classify\nI want to take Monday off\n=> leave_request\n"
+    "TASK: classify\nWe have a new developer joining\n=> onboarding\n"
+    "TASK: classify\nHere's the team’s monthly feedback\n=> pulse_check\n"
+    "TASK: classify\nCan I book next week as vacation?\n=> leave_request\n"
+    "TASK: classify\nPlease set up accounts for our new analyst\n=> onboarding\n"
+    "TASK: classify\nMorale survey results from the support team\n=> pulse_check\n"
+    "TASK: classify\nThanks, that's all for today\n=> You're welcome, have a great day!\n"
+    "TASK: extract leave_request\n"
+    "Employee E1042 needs 2025-03-03 to 2025-03-07 off for a family trip\n"
+    '=> {"employee_id": "E1042", "start_date": "2025-03-03", '
+    '"end_date": "2025-03-07", "reason": "family"}\n'
+    "TASK: extract leave_request\nI'm sick today\n"
+    '=> {"reason": "sick"}\n'
+    "TASK: extract onboarding\n"
+    "Jane Doe (jane.doe@acme.com) joins Finance as Senior Accountant on 2025-04-01, "
+    "employee id 00731, reporting to raj@acme.com\n"
+    '=> {"employee_id": "00731", "first_name": "Jane", "last_name": "Doe", '
+    '"email": "jane.doe@acme.com", "department": "Finance", '
+    '"role": "Senior Accountant", "start_date": "2025-04-01", '
+    '"manager_email": "raj@acme.com"}\n'
+    "TASK: extract onboarding\nNew hire Tom starts on 2025-05-12 in Engineering\n"
+    '=> {"first_name": "Tom", "department": "Engineering", "start_date": "2025-05-12"}\n'
+    "TASK: route\nE2210 would like leave from 2025-06-02 until 2025-06-04, medical\n"
+    '=> {"intent": "leave_request", "fields": {"employee_id": "E2210", '
+    '"start_date": "2025-06-02", "end_date": "2025-06-04", "reason": "medical"}}\n'
+    "TASK: route\nOnboard Priya Nair as a Data Engineer in Analytics from 2025-07-01\n"
+    '=> {"intent": "onboarding", "fields": {"first_name": "Priya", '
+    '"last_name": "Nair", "department": "Analytics", "role": "Data Engineer", '
+    '"start_date": "2025-07-01"}}\n'
+    "TASK: route\nQuarterly pulse: people feel stretched but positive\n"
+    '=> {"intent": "pulse_check", "fields": {}}\n'
+    "TASK: route\nMarco Rossi, marco.rossi@acme.com, employee 5521, starts 2025-09-15 "
+    "as Support Lead in Customer Success; manager is lena@acme.com\n"
+    '=> {"intent": "onboarding", "fields": {"employee_id": "5521", '
+    '"first_name": "Marco", "last_name": "Rossi", "email": "marco.rossi@acme.com", '
+    '"department": "Customer Success", "role": "Support Lead", '
+    '"start_date": "2025-09-15", "manager_email": "lena@acme.com"}}\n'
+    "TASK: route\nRequesting PTO 2025-12-22 through 2026-01-02 to visit family, ID E0087\n"
+    '=> {"intent": "leave_request", "fields": {"employee_id": "E0087", '
+    '"start_date": "2025-12-22", "end_date": "2026-01-02", "reason": "family"}}\n'
+    "TASK: route\nSharing anonymous feedback from the warehouse crew about shift changes\n"
+    '=> {"intent": "pulse_check", "fields": {}}\n'
+    "TASK: route\nI need to take 2025-08-11 off, personal reasons\n"
+    '=> {"intent": "leave_request", "fields": {"start_date": "2025-08-11", '
+    '"end_date": "2025-08-11", "reason": "personal"}}\n'
+    "TASK: classify\nWho should I talk to about payroll?\n"
+    "=> I can help with onboarding, leave requests and pulse checks.\n"
+    "TASK: route\nGood afternoon! How's it going?\n"
+    '=> {"intent": "smalltalk", "reply": "Good afternoon! How can I help with HR '
+    'today?", "fields": {}}\n'
+)
+
+def _task_messages(task: str, message: str) -> list:
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"TASK: {task}\n{message}"},
+    ]
+
+# -----------------------------
+# Response cache
+# -----------------------------
+_caches = []
+_cache_lock = threading.RLock()
+cache_stats = {"hits": 0, "semantic_hits": 0, "misses": 0}
+
+# Semantic tier: reuse answers for paraphrases (cosine similarity above threshold)
+SEMANTIC_THRESHOLD = 0.92
+SEMANTIC_MAX_ELEMENTS = 100_000
+# After a failed model load, skip the semantic tier for this long before retrying
+EMBED_RETRY_AFTER = 300.0
+_embedder = None
+_embedder_failed_at = None
+_embedder_lock = threading.Lock()
+
+def _embed(message: str):
+    global _embedder, _embedder_failed_at
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                if (_embedder_failed_at is not None
+                        and time.monotonic() - _embedder_failed_at < EMBED_RETRY_AFTER):
+                    raise RuntimeError("embedding model unavailable")
+                try:
+                    _embedder = TextEmbedding("BAAI/bge-small-en-v1.5")
+                except Exception:
+                    _embedder_failed_at = time.monotonic()
+                    raise
+    return next(_embedder.embed([message]))
+
+def canonicalize(message: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants compare equal."""
+    return _WS.sub(" ", _PUNCT.sub("", message.strip().lower())).strip()
+
+def _cache_key(fn_name: str, canonical: bool, message: str, others: list) -> str:
+    """Key on the function, deployment, other args and the message; the message is
+    stripped, or fully canonicalized when the cached value does not depend on its exact text."""
+    message = canonicalize(message) if canonical else message.strip()
+    raw = "|".join([fn_name, DEPLOYMENT or "", *map(str, others), message])
+    return hashlib.blake2b(raw.encode()).hexdigest()
+
+def cached(ttl: int = 3600, maxsize: int = 10_000, canonical: bool = False, semantic: bool = False):
+    """Serve repeated LLM calls from an LRU+TTL cache instead of hitting Azure.
+
+    canonical=True keys on canonicalize(message); only use it when the result
+    cannot depend on punctuation or case (classification, not field extraction).
+    With semantic=True, exact misses fall back to a nearest-neighbour lookup over
+    embeddings of previously answered messages.
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        _caches.append(cache)
+        if semantic:
+            index = hnswlib.Index(space="cosine", dim=384)
+            index.init_index(max_elements=SEMANTIC_MAX_ELEMENTS, allow_replace_deleted=True)
+            records = OrderedDict()  # label -> (inserted_at, result), oldest first
+            labels_seq = itertools.count()
+
+        def semantic_lookup(vec):
+            labels, dists = index.knn_query(vec, k=1)
+            label = int(labels[0][0])
+            if 1 - dists[0][0] <= SEMANTIC_THRESHOLD:
+                return None
+            inserted_at, result = records[label]
+            if time.monotonic() - inserted_at > ttl:
+                index.mark_deleted(label)
+                del records[label]
+                return None
+            return result
+
+        def semantic_store(vec, result):
+            now = time.monotonic()
+            replace = index.get_current_count() >= index.get_max_elements()
+            if replace:
+                # Records are in insertion (= time) order: free expired slots, or the
+                # oldest one when none are free, from the front for hnswlib to reuse
+                while records:
+                    label, (inserted_at, _) = next(iter(records.items()))
+                    if len(records) < index.get_max_elements() and now - inserted_at <= ttl:
+                        break
+                    index.mark_deleted(label)
+                    records.popitem(last=False)
+            label = next(labels_seq)
+            index.add_items(vec, label, replace_deleted=replace)
+            records[label] = (now, result)
+
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            message = bound.arguments["message"]
+            others = [v for k, v in bound.arguments.items() if k != "message"]
+            key = _cache_key(fn.__name__, canonical, message, others)
+            # Cached values are shared, so callers always get their own copy
+            with _cache_lock:
+                if key in cache:
+                    cache_stats["hits"] += 1
+                    return copy.deepcopy(cache[key])
+            vec = None
+            if semantic:
+                # Any embedding/index failure is treated as a semantic miss
+                try:
+                    vec = await asyncio.to_thread(_embed, canonicalize(message))
+                    with _cache_lock:
+                        hit = semantic_lookup(vec) if records else None
+                        if hit is not None:
+                            cache_stats["semantic_hits"] += 1
+                            cache[key] = hit
+                            return copy.deepcopy(hit)
+                except Exception:
+                    pass
+            with _cache_lock:
+                cache_stats["misses"] += 1
+            result = await fn(*bound.args, **bound.kwargs)
+            stored = copy.deepcopy(result)
+            with _cache_lock:
+                cache[key] = stored
+                if vec is not None:
+                    try:
+                        semantic_store(vec, stored)
+                    except Exception:
+                        pass
+            return result
+        return wrapper
+    return decorator
+
+def cache_metrics() -> dict:
+    with _cache_lock:
+        return {**cache_stats, "size": sum(len(c) for c in _caches)}
+
+def match_intent(message: str) -> str | None:
+    """Return the intent when exactly one keyword pattern matches, else None."""
+    canonical = canonicalize(message)
+    if canonical in CASUAL:
+        return f"smalltalk::{GREETING_REPLY}"
+    matches = [intent for intent, pattern in INTENT_PATTERNS.items() if pattern.search(message)]
+    if len(matches) == 1:
+        return matches[0]
+    greeting = GREETING_RE.match(canonical)
+    if (not matches and greeting
+            and len(canonical[greeting.end():].split()) <= GREETING_MAX_EXTRA_WORDS):
+        return f"smalltalk::{GREETING_REPLY}"
+    return None
+
+async def classify_intent(message: str) -> str:
+    # The keyword fast path runs before any cache tier so it never pays for an embedding
+    intent = match_intent(message)
+    if intent:
+        return intent
+    return await _classify_llm(message)
+
+@cached(ttl=3600, maxsize=10_000, canonical=True, semantic=True)
+async def _classify_llm(message: str) -> str:
+    response = await client.chat.completions.create(
+        model=DEPLOYMENT,
+        messages=_task_messages("classify", message),
+        temperature=0,
+        max_tokens=32,
+        stop=["\n"],
+    )
+    intent = response.choices[0].message.content.strip().lower()
+    if intent not in WEBHOOKS:
+        return f"smalltalk::{intent}"
+    return intent
+
+def _parse_json(content: str) -> dict:
+    try:
+        return orjson.loads(content)
+    except orjson.JSONDecodeError:
+        return orjson.loads(_FENCE_RE.sub("", content.strip()))
+
+async def _extract_json(task: str, message: str, max_tokens: int) -> dict:
+    response = await client.chat.completions.create(
+        model=DEPLOYMENT,
+        messages=_task_messages(task, message),
+        temperature=0,
+        max_tokens=max_tokens,
+        response_format={"type": "json_object"},
+    )
+    return _parse_json(response.choices[0].message.content)
+
+@cached(ttl=3600, maxsize=10_000)
+async def extract_fields(intent: str, message: str) -> dict:
+    if not REQUIRED_FIELDS.get(intent):
+        return {}
+    return await _extract_json(f"extract {intent}", message, max_tokens=256)
+
+def _filter_fields(intent: str, fields) -> dict:
+    """Keep only the intent's required fields; JSON mode guarantees an object, not this schema."""
+    if not isinstance(fields, dict):
+        return {}
+    wanted = REQUIRED_SET.get(intent, frozenset())
+    return {k: v for k, v in fields.items() if k in wanted}
+
+@cached(ttl=3600, maxsize=10_000)
+async def classify_and_extract(message: str) -> dict:
+    """Classify a message and extract its fields with a single LLM call."""
+    intent = match_intent(message)
+    if intent:
+        if not REQUIRED_FIELDS.get(intent):
+            return {"intent": intent, "fields": {}}
+        return {"intent": intent, "fields": _filter_fields(intent, await extract_fields(intent, message))}
+    data = await _extract_json("route", message, max_tokens=384)
+    intent = str(data.get("intent", "")).strip().lower()
+    if intent not in WEBHOOKS:
+        return {"intent": f"smalltalk::{data.get('reply') or intent}", "fields": {}}
+    return {"intent": intent, "fields": _filter_fields(intent, data.get("fields"))}
+
+async def submit_webhook(intent: str, data: dict) -> httpx.Response:
+    return await HTTP.post(
+        WEBHOOKS[intent],
+        content=orjson.dumps(data),
+        headers={"content-type": "application/json"},
+    )
+
+# -----------------------------
+# Batch pulse checks
+# -----------------------------
+def _batch_line(custom_id: str, message: str) -> bytes:
+    return orjson.dumps({
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/chat/completions",
+        "body": {
+            "model": BATCH_DEPLOYMENT,
+            "messages": _task_messages("route", message),
+            "temperature": 0,
+            "max_tokens": 384,
+            "response_format": {"type": "json_object"},
+        },
+    })
+
+async def submit_pulse_batch(messages: list[str]) -> str | None:
+    """Upload messages as a JSONL batch job and return the batch id (None if empty)."""
+    if not messages:
+        return None
+    jsonl = b"\n".join(_batch_line(str(i), m) for i, m in enumerate(messages))
+    batch_file = await client.files.create(file=("pulse_check.jsonl", jsonl), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/chat/completions",
+        completion_window="24h",
+    )
+    return batch.id
+
+# Batch states that can still change; anything else besides "completed" is final
+BATCH_PENDING_STATES = frozenset({"validating", "in_progress", "finalizing", "cancelling"})
+
+async def _file_lines(file_id: str | None) -> list[bytes]:
+    if not file_id:
+        return []
+    content = await client.files.content(file_id)
+    return content.content.splitlines()
+
+# custom_ids already posted to the webhook, per batch. Recorded only after a
+# successful post, so a later collect resends just the rows that failed.
+# This is per-process memory: a collect served by another worker, or after a
+# restart, does not see it and will post the batch's pulse checks again.
+_batch_deliveries = {}
+_collect_lock = asyncio.Lock()
+
+def _parse_batch_row(line: bytes, messages: dict) -> tuple[str, str, str]:
+    """Return (custom_id, intent, message) for one output row; raise if it is unusable."""
+    row = orjson.loads(line)
+    response = row.get("response") or {}
+    if row.get("error") or response.get("status_code") != 200:
+        raise ValueError(f"batch request {row.get('custom_id')} failed")
+    data = _parse_json(response["body"]["choices"][0]["message"]["content"])
+    if not isinstance(data, dict):
+        raise ValueError(f"batch request {row['custom_id']} returned {type(data).__name__}")
+    return row["custom_id"], str(data.get("intent", "")), messages[row["custom_id"]]
+
+async def collect_pulse_batch(batch_id: str) -> dict:
+    """Post the pulse_check results of a completed batch to the webhook.
+
+    Rows already delivered by an earlier collect in this process are not posted
+    again. Messages the batch classified as another intent are returned under
+    "not_pulse" so the caller can route them individually.
+    """
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status != "completed":
+        return {"status": batch.status}
+
+    async with _collect_lock:
+        messages = {}
+        for line in await _file_lines(batch.input_file_id):
+            row = orjson.loads(line)
+            messages[row["custom_id"]] = row["body"]["messages"][-1]["content"].split("\n", 1)[1]
+
+        # A batch where every request failed has no output file, only an error file
+        output = await _file_lines(batch.output_file_id)
+        errors = await _file_lines(batch.error_file_id)
+
+        delivered = _batch_deliveries.setdefault(batch_id, set())
+        pulse, not_pulse, already_sent, failed = [], [], 0, len(errors)
+        for line in output:
+            try:
+                custom_id, intent, message = _parse_batch_row(line, messages)
+            except Exception:
+                failed += 1
+                continue
+            if intent != "pulse_check":
+                not_pulse.append({"custom_id": custom_id, "intent": intent, "message": message})
+            elif custom_id in delivered:
+                already_sent += 1
+            else:
+                pulse.append((custom_id, message))
+
+        results = await asyncio.gather(
+            *(submit_webhook("pulse_check", {"message": message}) for _, message in pulse),
+            return_exceptions=True,
+        )
+        sent = post_failed = 0
+        for (custom_id, _), result in zip(pulse, results):
+            if isinstance(result, Exception) or result.status_code != 200:
+                post_failed += 1
+            else:
+                delivered.add(custom_id)
+                sent += 1
+
+    return {
+        "status": batch.status,
+        "sent": sent,
+        "already_sent": already_sent,
+        "not_pulse": not_pulse,
+        "failed": failed,
+        "post_failed": post_failed,
+    }
+
+# -----------------------------
+# Startup warm-up
+# -----------------------------
+async def warm_up(timeout: float = 15.0) -> None:
+    """Open webhook/Azure connections and load the embedder before the first request."""
+    warmers = [
+        *(HTTP.head(url) for url in WEBHOOKS.values()),
+        client.chat.completions.create(
+            model=DEPLOYMENT,
+            messages=_task_messages("classify", "ping"),
+            max_tokens=1,
+        ),
+        asyncio.to_thread(_embed, "ping"),
+    ]
+    try:
+        await asyncio.wait_for(asyncio.gather(*warmers, return_exceptions=True), timeout)
+    except asyncio.TimeoutError:
+        pass
@@ -0,0 +1,99 @@
+import os
+from types import SimpleNamespace
+
+# The Azure client is built at import time, so configure it before importing optiflow
+for name, value in {
+    "AZURE_OPENAI_KEY": "test-key",
+    "AZURE_OPENAI_API_VERSION": "2024-10-21",
+    "AZURE_OPENAI_ENDPOINT": "https://test.openai.azure.com",
+    "AZURE_OPENAI_DEPLOYMENT": "test-deployment",
+}.items():
+    os.environ.setdefault(name, value)
+
+import orjson
+import pytest
+
+from optiflow import core
+
+
+def completion(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeClient:
+    """Stand-in for AsyncAzureOpenAI covering the chat, files and batches calls we make."""
+
+    def __init__(self):
+        self.replies = []  # chat completion contents, served in order
+        self.chat_calls = []
+        self.files_data = {}
+        self.uploads = []
+        self.batch = None
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._chat_create))
+        self.files = SimpleNamespace(create=self._files_create, content=self._files_content)
+        self.batches = SimpleNamespace(create=self._batches_create, retrieve=self._batches_retrieve)
+
+    async def _chat_create(self, **kwargs):
+        self.chat_calls.append(kwargs)
+        return completion(self.replies.pop(0))
+
+    async def _files_create(self, file, purpose):
+        name, data = file
+        file_id = f"file-{len(self.uploads)}"
+        self.uploads.append((name, data, purpose))
+        self.files_data[file_id] = data
+        return SimpleNamespace(id=file_id)
+
+    async def _files_content(self, file_id):
+        return SimpleNamespace(content=self.files_data[file_id])
+
+    async def _batches_create(self, **kwargs):
+        self.batch = SimpleNamespace(id="batch-1", status="validating", **kwargs)
+        return self.batch
+
+    async def _batches_retrieve(self, batch_id):
+        return self.batch
+
+
+class FakeHTTP:
+    """Stand-in for the shared httpx client; statuses (or exceptions) are served in order."""
+
+    def __init__(self):
+        self.posts = []
+        self.statuses = []
+
+    async def post(self, url, content, headers):
+        self.posts.append((url, orjson.loads(content)))
+        status = self.statuses.pop(0) if self.statuses else 200
+        if isinstance(status, Exception):
+            raise status
+        return SimpleNamespace(status_code=status)
+
+
+@pytest.fixture(autouse=True)
+def isolated_state(monkeypatch):
+    """Empty every cache and keep the real embedding model out of the tests."""
+    def no_model(*args, **kwargs):
+        raise OSError("embedding model not available in tests")
+
+    monkeypatch.setattr(core, "TextEmbedding", no_model)
+    monkeypatch.setattr(core, "_embedder", None)
+    monkeypatch.setattr(core, "_embedder_failed_at", None)
+    monkeypatch.setattr(core, "_batch_deliveries", {})
+    monkeypatch.setattr(core, "cache_stats", {"hits": 0, "semantic_hits": 0, "misses": 0})
+    for cache in core._caches:
+        cache.clear()
+
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    fake = FakeClient()
+    monkeypatch.setattr(core, "client", fake)
+    return fake
+
+
+@pytest.fixture
+def fake_http(monkeypatch):
+    fake = FakeHTTP()
+    monkeypatch.setattr(core, "HTTP", fake)
+    return fake
@@ -0,0 +1,123 @@
+import asyncio
+
+import orjson
+
+from optiflow import core
+
+
+def output_row(custom_id: str, content: str, status_code: int = 200) -> bytes:
+    return orjson.dumps({
+        "custom_id": custom_id,
+        "response": {
+            "status_code": status_code,
+            "body": {"choices": [{"message": {"content": content}}]},
+        },
+        "error": None,
+    })
+
+
+def complete_batch(fake_client, messages, output_rows, error_rows=()):
+    """Submit messages, then mark the batch completed with the given output/error rows."""
+    batch_id = asyncio.run(core.submit_pulse_batch(messages))
+    fake_client.files_data["out"] = b"\n".join(output_rows)
+    fake_client.files_data["err"] = b"\n".join(error_rows)
+    fake_client.batch.status = "completed"
+    fake_client.batch.output_file_id = "out" if output_rows else None
+    fake_client.batch.error_file_id = "err" if error_rows else None
+    return batch_id
+
+
+def test_batch_line_builds_route_request():
+    line = orjson.loads(core._batch_line("7", "Team morale is low"))
+
+    assert line["custom_id"] == "7"
+    assert line["method"] == "POST"
+    assert line["url"] == "/chat/completions"
+    body = line["body"]
+    assert body["model"] == core.BATCH_DEPLOYMENT
+    assert body["response_format"] == {"type": "json_object"}
+    assert body["messages"][0] == {"role": "system", "content": core.SYSTEM_PROMPT}
+    assert body["messages"][-1]["content"] == "TASK: route\nTeam morale is low"
+
+
+def test_submit_pulse_batch_skips_empty_input(fake_client):
+    assert asyncio.run(core.submit_pulse_batch([])) is None
+    assert fake_client.uploads == []
+
+
+def test_submit_pulse_batch_uploads_one_line_per_message(fake_client):
+    batch_id = asyncio.run(core.submit_pulse_batch(["first", "second"]))
+
+    assert batch_id == "batch-1"
+    name, data, purpose = fake_client.uploads[0]
+    assert (name, purpose) == ("pulse_check.jsonl", "batch")
+    assert [orjson.loads(line)["custom_id"] for line in data.splitlines()] == ["0", "1"]
+    assert fake_client.batch.input_file_id == "file-0"
+    assert fake_client.batch.completion_window == "24h"
+
+
+def test_collect_reports_unfinished_batch(fake_client, fake_http):
+    asyncio.run(core.submit_pulse_batch(["first"]))
+
+    assert asyncio.run(core.collect_pulse_batch("batch-1")) == {"status": "validating"}
+    assert fake_http.posts == []
+
+
+def test_collect_posts_pulse_rows_and_returns_the_rest(fake_client, fake_http):
+    batch_id = complete_batch(
+        fake_client,
+        ["morale is great", "E1 wants leave", "broken", "refused", "fenced pulse"],
+        [
+            output_row("0", '{"intent": "pulse_check", "fields": {}}'),
+            output_row("1", '{"intent": "leave_request", "fields": {}}'),
+            output_row("2", "not json"),
+            output_row("3", "", status_code=500),
+            output_row("4", '```json\n{"intent": "pulse_check"}\n```'),
+        ],
+        error_rows=[b'{"custom_id": "5", "error": {"code": "x"}}'],
+    )
+
+    result = asyncio.run(core.collect_pulse_batch(batch_id))
+
+    assert result == {
+        "status": "completed",
+        "sent": 2,
+        "already_sent": 0,
+        "not_pulse": [{"custom_id": "1", "intent": "leave_request", "message": "E1 wants leave"}],
+        "failed": 3,
+        "post_failed": 0,
+    }
+    assert sorted(data["message"] for _, data in fake_http.posts) == ["fenced pulse", "morale is great"]
+    assert {url for url, _ in fake_http.posts} == {core.WEBHOOKS["pulse_check"]}
+
+
+def test_collect_retries_only_failed_posts(fake_client, fake_http):
+    batch_id = complete_batch(
+        fake_client,
+        ["a", "b", "c"],
+        [output_row(str(i), '{"intent": "pulse_check"}') for i in range(3)],
+    )
+    fake_http.statuses = [200, 502, RuntimeError("connection reset")]
+
+    first = asyncio.run(core.collect_pulse_batch(batch_id))
+    second = asyncio.run(core.collect_pulse_batch(batch_id))
+    third = asyncio.run(core.collect_pulse_batch(batch_id))
+
+    assert (first["sent"], first["already_sent"], first["post_failed"]) == (1, 0, 2)
+    assert (second["sent"], second["already_sent"], second["post_failed"]) == (2, 1, 0)
+    assert (third["sent"], third["already_sent"], third["post_failed"]) == (0, 3, 0)
+    assert sorted(data["message"] for _, data in fake_http.posts[3:]) == ["b", "c"]
+
+
+def test_collect_handles_batch_without_output_file(fake_client, fake_http):
+    batch_id = complete_batch(
+        fake_client,
+        ["a", "b"],
+        [],
+        error_rows=[b'{"custom_id": "0"}', b'{"custom_id": "1"}'],
+    )
+
+    result = asyncio.run(core.collect_pulse_batch(batch_id))
+
+    assert (result["sent"], result["failed"], result["not_pulse"]) == (0, 2, [])
+    assert fake_http.posts == []
@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from optiflow import core
+
+
+def unit(*weights: float) -> np.ndarray:
+    """A 384-d unit vector with the given leading components."""
+    vec = np.zeros(384, dtype=np.float32)
+    vec[:len(weights)] = weights
+    return vec / np.linalg.norm(vec)
+
+
+def counting(**cache_kwargs):
+    """A cached coroutine that records the messages it actually computed."""
+    computed = []
+
+    @core.cached(**cache_kwargs)
+    async def answer(message: str, suffix: str = "") -> dict:
+        computed.append(message)
+        return {"answer": message + suffix, "tags": []}
+
+    return answer, computed
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    """Serve embeddings from a dict keyed on the canonical message."""
+    vectors = {}
+    monkeypatch.setattr(core, "_embed", lambda message: vectors[message])
+    return vectors
+
+
+def test_exact_hit_is_shared_between_positional_and_keyword_calls():
+    answer, computed = counting()
+
+    first = asyncio.run(answer("Hello", "!"))
+    second = asyncio.run(answer(message="  Hello ", suffix="!"))
+
+    assert first == second == {"answer": "Hello!", "tags": []}
+    assert computed == ["Hello"]
+    assert core.cache_metrics()["hits"] == 1
+
+
+def test_other_arguments_are_part_of_the_key():
+    answer, computed = counting()
+
+    asyncio.run(answer("Hello", "!"))
+    asyncio.run(answer("Hello", "?"))
+
+    assert computed == ["Hello", "Hello"]
+
+
+def test_hits_return_copies():
+    answer, _ = counting()
+
+    asyncio.run(answer("Hello"))["tags"].append("mutated")
+
+    assert asyncio.run(answer("Hello"))["tags"] == []
+
+
+def test_canonical_key_ignores_case_and_punctuation():
+    raw, raw_computed = counting()
+    canonical, canonical_computed = counting(canonical=True)
+
+    for message in ("Hello, World!", "hello   world"):
+        asyncio.run(raw(message))
+        asyncio.run(canonical(message))
+
+    assert raw_computed == ["Hello, World!", "hello   world"]
+    assert canonical_computed == ["Hello, World!"]
+
+
+def test_entries_expire_after_ttl():
+    answer, computed = counting(ttl=0.05)
+
+    asyncio.run(answer("Hello"))
+    time.sleep(0.1)
+    asyncio.run(answer("Hello"))
+
+    assert computed == ["Hello", "Hello"]
+
+
+def test_semantic_hit_for_paraphrase(embeddings):
+    embeddings.update({
+        "i need a day off": unit(1, 0),
+        "i need one day off": unit(1, 0.1),
+        "payroll question": unit(0, 1),
+    })
+    answer, computed = counting(semantic=True)
+
+    asyncio.run(answer("I need a day off"))
+    paraphrase = asyncio.run(answer("I need one day off"))
+    asyncio.run(answer("Payroll question"))
+
+    assert paraphrase == {"answer": "I need a day off", "tags": []}
+    assert computed == ["I need a day off", "Payroll question"]
+    assert core.cache_metrics()["semantic_hits"] == 1
+
+
+def test_semantic_records_expire(embeddings):
+    embeddings.update({"a": unit(1, 0), "a again": unit(1, 0.01)})
+    answer, computed = counting(ttl=0.05, semantic=True)
+
+    asyncio.run(answer("a"))
+    time.sleep(0.1)
+    asyncio.run(answer("a again"))
+
+    assert computed == ["a", "a again"]
+
+
+def test_semantic_store_evicts_oldest_when_full(embeddings, monkeypatch):
+    monkeypatch.setattr(core, "SEMANTIC_MAX_ELEMENTS", 2)
+    embeddings.update({
+        "a": unit(1, 0, 0), "b": unit(0, 1, 0), "c": unit(0, 0, 1),
+        "a2": unit(1, 0.01, 0), "c2": unit(0, 0.01, 1),
+    })
+    answer, computed = counting(semantic=True)
+
+    for message in ("a", "b", "c"):
+        asyncio.run(answer(message))
+    asyncio.run(answer("c2"))
+    asyncio.run(answer("a2"))
+
+    assert computed == ["a", "b", "c", "a2"]
+
+
+def test_embedding_failure_falls_back_to_the_llm(monkeypatch):
+    calls = []
+
+    def broken_model(*args, **kwargs):
+        calls.append(args)
+        raise OSError("offline")
+
+    monkeypatch.setattr(core, "TextEmbedding", broken_model)
+    answer, computed = counting(semantic=True)
+
+    asyncio.run(answer("first"))
+    asyncio.run(answer("second"))
+
+    assert computed == ["first", "second"]
+    # The failed load is remembered, so the second call does not retry it
+    assert len(calls) == 1
+
+
+def test_embedding_model_load_is_retried_after_backoff(monkeypatch):
+    calls = []
+
+    def broken_model(*args, **kwargs):
+        calls.append(args)
+        raise OSError("offline")
+
+    monkeypatch.setattr(core, "TextEmbedding", broken_model)
+    with pytest.raises(OSError):
+        core._embed("hello")
+    with pytest.raises(RuntimeError):
+        core._embed("hello")
+
+    monkeypatch.setattr(core, "_embedder_failed_at", time.monotonic() - core.EMBED_RETRY_AFTER - 1)
+    with pytest.raises(OSError):
+        core._embed("hello")
+    assert len(calls) == 2
@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from optiflow import core
+
+SMALLTALK = f"smalltalk::{core.GREETING_REPLY}"
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Hello!", SMALLTALK),
+    ("how are you?", SMALLTALK),
+    ("hi there team", SMALLTALK),
+    ("I'd like to take Friday off as vacation", "leave_request"),
+    ("Can I book 3 days off?", "leave_request"),
+    ("Please onboard our new analyst", "onboarding"),
+    ("Onboarding checklist for Priya", "onboarding"),
+    ("Monthly morale survey results", "pulse_check"),
+    ("Hi, I need to take Monday off", "leave_request"),
+    # Greetings followed by a real question are left to the LLM
+    ("hello can you tell me about payroll", None),
+    # Ambiguous: more than one intent matches
+    ("feedback on the new hire", None),
+    ("Who handles payroll?", None),
+])
+def test_match_intent(message, expected):
+    assert core.match_intent(message) == expected
+
+
+def test_classify_intent_uses_the_fast_path_before_the_llm(fake_client):
+    assert asyncio.run(core.classify_intent("Team pulse is positive")) == "pulse_check"
+    assert fake_client.chat_calls == []
+
+
+def test_classify_intent_falls_back_to_the_llm(fake_client):
+    fake_client.replies = ["Onboarding\n"]
+
+    assert asyncio.run(core.classify_intent("Who handles payroll?")) == "onboarding"
+    assert fake_client.chat_calls[0]["messages"][-1]["content"] == "TASK: classify\nWho handles payroll?"
+
+
+@pytest.mark.parametrize("message, reply", [
+    # Fast path: fields come from extract_fields
+    ("E1 wants vacation", '{"employee_id": "E1", "reason": "vacation", "salary": 1}'),
+    # LLM route: fields come back inside the route reply
+    ("E1 is away next week",
+     '{"intent": "leave_request", "fields": {"employee_id": "E1", "reason": "vacation", "salary": 1}}'),
+])
+def test_classify_and_extract_keeps_only_required_fields(fake_client, message, reply):
+    fake_client.replies = [reply]
+
+    assert asyncio.run(core.classify_and_extract(message)) == {
+        "intent": "leave_request",
+        "fields": {"employee_id": "E1", "reason": "vacation"},
+    }
+
+
+def test_classify_and_extract_drops_non_object_fields(fake_client):
+    fake_client.replies = ['{"intent": "onboarding", "fields": ["Jane"]}']
+
+    assert asyncio.run(core.classify_and_extract("Jane from Finance")) == {
+        "intent": "onboarding", "fields": {},
+    }
+
+
+def test_classify_and_extract_smalltalk_reply(fake_client):
+    fake_client.replies = ['{"intent": "smalltalk", "reply": "Happy to help!", "fields": {}}']
+
+    assert asyncio.run(core.classify_and_extract("thanks a lot")) == {
+        "intent": "smalltalk::Happy to help!", "fields": {},
+    }